@@ -0,0 +1,132 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from api.models import (
+    AggregationCheckpoint, Comment, Followers, Like, Post, PostRollup, PostView,
+    SavedPost, UserRollup,
+)
+from api.routers import pin_to_primary, unpin
+
+
+def _post_source(queryset, time_field, post_field, metric):
+    return {"queryset": queryset, "time_field": time_field, "target_field": post_field, "metric": metric, "per_post": True}
+
+
+def sources():
+    """Event tables folded into the rollups, keyed by checkpoint name."""
+    post_type = ContentType.objects.get_for_model(Post)
+    return {
+        "like": _post_source(Like.objects.filter(content_type=post_type), "liked_at", "object_id", "likes"),
+        "comment": _post_source(Comment.objects.filter(content_type=post_type), "created_at", "object_id", "comments"),
+        "save": _post_source(SavedPost.objects.all(), "created_at", "post_id", "saves"),
+        "view": _post_source(PostView.objects.all(), "viewed_at", "post_id", "views"),
+        "follow": {
+            "queryset": Followers.objects.all(), "time_field": "followed_at",
+            "target_field": "following_id", "metric": "new_followers", "per_post": False,
+        },
+    }
+
+
+def _apply(model, owner_field, metric, increments):
+    """Add `increments` ({(owner, granularity, bucket): n}) onto `model` rows."""
+    if not increments:
+        return
+    owners = {owner for owner, _, _ in increments}
+    buckets = {bucket for _, _, bucket in increments}
+    existing = model.objects.select_for_update().filter(**{f"{owner_field}__in": owners}, bucket__in=buckets)
+    to_update = []
+    for row in existing:
+        key = (getattr(row, owner_field), row.granularity, row.bucket)
+        if key in increments:
+            setattr(row, metric, getattr(row, metric) + increments.pop(key))
+            to_update.append(row)
+    model.objects.bulk_update(to_update, [metric])
+    model.objects.bulk_create([
+        model(**{owner_field: owner, "granularity": granularity, "bucket": bucket, metric: n})
+        for (owner, granularity, bucket), n in increments.items()
+    ])
+
+
+def aggregate_source(name, source, now=None, batch_size=None):
+    """
+    Fold the next batch of `source` rows past its high-water mark into the
+    hourly and daily rollups. Returns the number of rows consumed.
+
+    The GROUP BY only ever covers the new primary key range, so the cost of a
+    run depends on how much happened since the last one, not on table size.
+    """
+    # Rollups are read-modify-write, so never read them from a lagging replica.
+    token = pin_to_primary()
+    try:
+        return _aggregate_source(name, source, now, batch_size)
+    finally:
+        unpin(token)
+
+
+def _aggregate_source(name, source, now, batch_size):
+    now = now or timezone.now()
+    batch_size = batch_size or settings.ANALYTICS_BATCH_SIZE
+    cutoff = now - timedelta(seconds=settings.ANALYTICS_LAG_SECONDS)
+
+    with transaction.atomic():
+        checkpoint, _ = AggregationCheckpoint.objects.select_for_update().get_or_create(source=name)
+        pending = source["queryset"].filter(pk__gt=checkpoint.last_id)
+        ids = list(
+            pending.filter(**{f"{source['time_field']}__lte": cutoff})
+            .order_by("pk").values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        groups = (
+            pending.filter(pk__lte=ids[-1])
+            .annotate(hour=TruncHour(source["time_field"]))
+            .values(source["target_field"], "hour")
+            .annotate(n=Count("pk"))
+            .order_by()
+        )
+
+        post_counts = defaultdict(int)
+        user_counts = defaultdict(int)
+        owners = {}
+        if source["per_post"]:
+            groups = list(groups)
+            post_ids = {group[source["target_field"]] for group in groups}
+            owners = dict(Post.objects.filter(post_id__in=post_ids).values_list("post_id", "user_id"))
+        for group in groups:
+            target, hour, n = group[source["target_field"]], group["hour"], group["n"]
+            if source["per_post"] and target not in owners:
+                continue  # the post has since been deleted
+            day = hour.replace(hour=0)
+            for granularity, bucket in (("hour", hour), ("day", day)):
+                if source["per_post"]:
+                    post_counts[(target, granularity, bucket)] += n
+                    user_counts[(owners[target], granularity, bucket)] += n
+                else:
+                    user_counts[(target, granularity, bucket)] += n
+
+        _apply(PostRollup, "post_id", source["metric"], post_counts)
+        _apply(UserRollup, "user_id", source["metric"], user_counts)
+        checkpoint.last_id = ids[-1]
+        checkpoint.save(update_fields=["last_id", "updated_at"])
+    return len(ids)
+
+
+def aggregate_all(now=None, batch_size=None):
+    """Run every source until it has caught up with the lag cutoff."""
+    now = now or timezone.now()
+    totals = {}
+    for name, source in sources().items():
+        totals[name] = 0
+        while True:
+            consumed = aggregate_source(name, source, now, batch_size)
+            totals[name] += consumed
+            if not consumed:
+                break
+    return totals
@@ -0,0 +1,172 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.models import (
+    AccountDeletion, Comment, Followers, Hashtags, Like, Message, Notification,
+    Post, PostImage, PostRollup, PostView, SavedPost, Story, UploadSession, User,
+    UserRollup,
+)
+from api.uploads import session_path
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_in_batches(queryset, batch_size, before_delete=None):
+    """
+    Delete `queryset` one bounded batch of primary keys at a time.
+
+    Each batch runs in its own short transaction so no single statement holds
+    locks on a large table for long. `before_delete(pks, batch_size)` runs
+    ahead of each batch to clear rows the database cascade does not cover.
+    """
+    deleted = 0
+    model = queryset.model
+    while True:
+        pks = list(queryset.order_by().values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        if before_delete:
+            deleted += before_delete(pks, batch_size)
+        with transaction.atomic():
+            count, _ = model.objects.filter(pk__in=pks).delete()
+        deleted += count
+
+
+def _update_in_batches(queryset, batch_size, **values):
+    """Like `_delete_in_batches`, for rows that are detached rather than deleted."""
+    updated = 0
+    model = queryset.model
+    while True:
+        pks = list(queryset.order_by().values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return updated
+        with transaction.atomic():
+            updated += model.objects.filter(pk__in=pks).update(**values)
+
+
+def _delete_media(names):
+    # Django never removes files when rows are deleted, so do it explicitly.
+    for name in names:
+        if name:
+            default_storage.delete(name)
+
+
+def _delete_generic_dependents(model, pks, batch_size):
+    # Likes, comments and hashtags reference their target through a generic
+    # relation, so they are not removed by the database cascade.
+    content_type = ContentType.objects.get_for_model(model)
+    deleted = _delete_in_batches(
+        Comment.objects.filter(content_type=content_type, object_id__in=pks), batch_size, _delete_comment_dependents
+    )
+    for dependent in (Like, Hashtags):
+        deleted += _delete_in_batches(dependent.objects.filter(content_type=content_type, object_id__in=pks), batch_size)
+    return deleted
+
+
+def _delete_comment_dependents(pks, batch_size):
+    # Replies through `parent` would cascade, but their own likes and replies
+    # would not, so walk them explicitly.
+    deleted = _delete_in_batches(Comment.objects.filter(parent_id__in=pks), batch_size, _delete_comment_dependents)
+    return deleted + _delete_generic_dependents(Comment, pks, batch_size)
+
+
+def _delete_story_dependents(pks, batch_size):
+    _delete_media(Story.objects.filter(pk__in=pks).values_list("image", flat=True))
+    return _delete_generic_dependents(Story, pks, batch_size)
+
+
+def _delete_post_image_files(pks, batch_size):
+    _delete_media(PostImage.objects.filter(pk__in=pks).values_list("image", flat=True))
+    return 0
+
+
+def _delete_post_dependents(pks, batch_size):
+    deleted = _delete_generic_dependents(Post, pks, batch_size)
+    deleted += _delete_in_batches(PostImage.objects.filter(post_id__in=pks), batch_size, _delete_post_image_files)
+    querysets = [
+        model.objects.filter(post_id__in=pks)
+        for model in (SavedPost, PostView, PostRollup)
+    ]
+    return deleted + sum(_delete_in_batches(queryset, batch_size) for queryset in querysets)
+
+
+def _detach_message_references(pks, batch_size):
+    # replied_to / forward_from use DO_NOTHING, so clear them before the
+    # referenced messages disappear.
+    Message.objects.filter(replied_to_id__in=pks).update(replied_to=None)
+    Message.objects.filter(forward_from_id__in=pks).update(forward_from=None)
+    return 0
+
+
+def _discard_upload_files(pks, batch_size):
+    for session in UploadSession.objects.filter(pk__in=pks):
+        session_path(session).unlink(missing_ok=True)
+    return 0
+
+
+def delete_account(user, batch_size=None):
+    """Remove everything that depends on `user` in bounded batches, then the user."""
+    batch_size = batch_size or settings.ACCOUNT_DELETION_BATCH_SIZE
+    steps = [
+        (Like.objects.filter(user=user), None),
+        (Comment.objects.filter(user=user), _delete_comment_dependents),
+        (SavedPost.objects.filter(user=user), None),
+        (Post.objects.filter(user=user), _delete_post_dependents),
+        (Story.objects.filter(user=user), _delete_story_dependents),
+        (Followers.objects.filter(follower=user), None),
+        (Followers.objects.filter(following=user), None),
+        (Notification.objects.filter(user=user), None),
+        (Message.objects.filter(sender=user), _detach_message_references),
+        (Message.objects.filter(recipient=user), _detach_message_references),
+        (UploadSession.objects.filter(user=user), _discard_upload_files),
+        (UserRollup.objects.filter(user=user), None),
+        (Message.deleted_for_user.through.objects.filter(user=user), None),
+    ]
+    deleted = sum(_delete_in_batches(queryset, batch_size, hook) for queryset, hook in steps)
+    # Other users' posts keep their view counts; only the viewer is forgotten.
+    _update_in_batches(PostView.objects.filter(user=user), batch_size, user=None)
+    _delete_media([user.profile_pic.name])
+    count, _ = user.delete()
+    return deleted + count
+
+
+def process_pending_deletions(batch_size=None):
+    """
+    Run every outstanding AccountDeletion request and return how many finished.
+
+    Each request is claimed with a conditional update, so overlapping workers
+    never process the same account. Requests left 'running' for longer than
+    ACCOUNT_DELETION_STALE_SECONDS by an interrupted worker are claimed again;
+    every step is safe to repeat. A failing request goes back to 'pending'
+    and the rest of the queue carries on.
+    """
+    processed = 0
+    stale = timezone.now() - timedelta(seconds=settings.ACCOUNT_DELETION_STALE_SECONDS)
+    outstanding = AccountDeletion.objects.filter(
+        Q(status='pending') | Q(status='running', claimed_at__lt=stale)
+    ).order_by('requested_at')
+    for request in outstanding:
+        claimed = AccountDeletion.objects.filter(
+            pk=request.pk, status=request.status, claimed_at=request.claimed_at
+        ).update(status='running', claimed_at=timezone.now())
+        if not claimed:
+            continue  # another worker got there first
+        try:
+            user = User.objects.filter(user_id=request.account).first()
+            rows = delete_account(user, batch_size) if user else 0
+        except Exception:
+            logger.exception("Deleting account %s failed", request.account)
+            AccountDeletion.objects.filter(pk=request.pk).update(status='pending', claimed_at=None)
+            continue
+        AccountDeletion.objects.filter(pk=request.pk).update(
+            status='done', rows_deleted=rows, completed_at=timezone.now()
+        )
+        processed += 1
+    return processed
@@ -0,0 +1,100 @@
+import json
+import zipfile
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from api.models import Comment, Followers, Like, Message, Post, PostImage, SavedPost, Story
+
+
+class _StreamBuffer:
+    """Write-only file object that zipfile writes into and the generator drains."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def export_records(user):
+    """
+    Yield (section, row) pairs for everything a user owns.
+
+    Every queryset is read with `.values()` and `.iterator(chunk_size=...)` so
+    only one chunk of rows is held in memory at a time.
+    """
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    yield "profile", {
+        "user_id": user.user_id,
+        "username": user.username,
+        "email": user.email,
+        "bio": user.bio,
+        "gender": user.gender,
+        "created_at": user.created_at,
+        "profile_pic": user.profile_pic.name or None,
+    }
+    sections = [
+        ("posts", Post.objects.filter(user=user).values("post_id", "caption", "created_at")),
+        ("post_images", PostImage.objects.filter(post__user=user).values("id", "post_id", "image")),
+        ("stories", Story.objects.filter(user=user).values("story_id", "image", "created_at", "expires_at")),
+        ("comments", Comment.objects.filter(user=user).values("id", "content_type__model", "object_id", "parent_id", "commented_text", "created_at")),
+        ("likes", Like.objects.filter(user=user).values("content_type__model", "object_id", "liked_at")),
+        ("saved_posts", SavedPost.objects.filter(user=user).values("post_id", "created_at")),
+        ("messages", Message.objects.filter(Q(sender=user) | Q(recipient=user)).values(
+            "id", "sender_id", "recipient_id", "subject", "content", "sent_at", "read_at", "is_read",
+            "edited_at", "is_edited", "is_draft", "scheduled_at", "replied_to_id", "forward_from_id")),
+        ("followers", Followers.objects.filter(following=user).values("follower_id", "followed_at")),
+        ("following", Followers.objects.filter(follower=user).values("following_id", "followed_at")),
+    ]
+    for section, queryset in sections:
+        for row in queryset.order_by().iterator(chunk_size=chunk_size):
+            yield section, row
+
+
+def ndjson_lines(user):
+    for section, row in export_records(user):
+        yield json.dumps({"type": section, **row}, cls=DjangoJSONEncoder).encode() + b"\n"
+
+
+def _media_names(user):
+    if user.profile_pic:
+        yield user.profile_pic.name
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    yield from PostImage.objects.filter(post__user=user).values_list("image", flat=True).iterator(chunk_size=chunk_size)
+    yield from Story.objects.filter(user=user).values_list("image", flat=True).iterator(chunk_size=chunk_size)
+
+
+def zip_archive(user, storage):
+    """
+    Yield a zip archive of the NDJSON export plus the user's media files.
+
+    The archive is written to an unseekable buffer, so zipfile emits data
+    descriptors and each piece can be sent as soon as it is produced.
+    """
+    buffer = _StreamBuffer()
+    block_size = settings.EXPORT_MEDIA_BLOCK_SIZE
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("data.ndjson", "w", force_zip64=True) as entry:
+            for line in ndjson_lines(user):
+                entry.write(line)
+                yield buffer.drain()
+
+        for name in _media_names(user):
+            if not name or not storage.exists(name):
+                continue
+            with storage.open(name, "rb") as media, archive.open(f"media/{name}", "w", force_zip64=True) as entry:
+                for block in iter(lambda: media.read(block_size), b""):
+                    entry.write(block)
+                    yield buffer.drain()
+    yield buffer.drain()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.analytics import aggregate_all
+
+
+class Command(BaseCommand):
+    help = "Fold new likes, comments, saves, views and follows into the hourly and daily rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        totals = aggregate_all(batch_size=options["batch_size"])
+        for source, consumed in totals.items():
+            self.stdout.write(f"{source}: {consumed} new row(s)")
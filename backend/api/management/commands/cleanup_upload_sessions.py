@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.uploads import cleanup_abandoned_sessions
+
+
+class Command(BaseCommand):
+    help = "Remove expired upload sessions, old completed ones, and orphaned partial files."
+
+    def handle(self, *args, **options):
+        removed = cleanup_abandoned_sessions()
+        self.stdout.write(f"Removed {removed} stale upload session(s).")
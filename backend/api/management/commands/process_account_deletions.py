@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.deletion import process_pending_deletions
+
+
+class Command(BaseCommand):
+    help = "Delete accounts queued for removal, a bounded batch of rows at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        processed = process_pending_deletions(options["batch_size"])
+        self.stdout.write(f"Processed {processed} account deletion(s).")
@@ -0,0 +1,34 @@
+from django.conf import settings
+
+from api.routers import choose_replica, pin_to_primary, release_replica, unpin
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Read-your-writes for the replica router.
+
+    Unsafe requests read from the primary for their whole duration and mark
+    the client with a short-lived cookie; requests carrying that cookie read
+    from the primary too until it expires.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = settings.REPLICA_STICKY_COOKIE
+        writing = request.method not in SAFE_METHODS
+        token = pin_to_primary(writing or cookie in request.COOKIES)
+        replica_token = choose_replica()
+        try:
+            response = self.get_response(request)
+            if writing:
+                response.set_cookie(
+                    cookie, "1", max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite="Lax"
+                )
+        finally:
+            release_replica(replica_token)
+            unpin(token)
+        return response
@@ -1,7 +1,9 @@
 from django.db import models
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 import re
+import uuid
 from django.core.exceptions import ValidationError
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
@@ -187,4 +189,101 @@ class Message(models.Model):
             self.content = "[This message was deleted]"
             self.save()
         else:
-            self.deleted_for_user.add(user)
\ No newline at end of file
+            self.deleted_for_user.add(user)
+
+def default_upload_expiry():
+    return timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+class UploadSession(models.Model):
+    upload_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions")
+    target = models.CharField(max_length=20, choices=[
+    ('post_image', 'Post image'),
+    ('story', 'Story'),
+    ('profile_pic', 'Profile picture'),
+    ])
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name="upload_sessions")
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    checksum = models.CharField(max_length=64)  # sha256 hex digest of the whole file
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=[
+    ('pending', 'Pending'),
+    ('complete', 'Complete'),
+    ], default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=default_upload_expiry, db_index=True)
+
+    def __str__(self):
+        return f"Upload {self.upload_id} by {self.user.username} ({self.received_bytes}/{self.total_size})"
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+class AccountDeletion(models.Model):
+    # Plain user_id rather than a ForeignKey: the request outlives the user row.
+    account = models.CharField(max_length=15, unique=True)
+    status = models.CharField(max_length=20, choices=[
+    ('pending', 'Pending'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ], default='pending', db_index=True)
+    rows_deleted = models.PositiveBigIntegerField(default=0)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)  # when a worker last took the request
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Deletion of {self.account} ({self.status})"
+
+class PostView(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="view_events")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="post_views")
+    viewed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"View of Post {self.post_id}"
+
+class EngagementRollup(models.Model):
+    granularity = models.CharField(max_length=4, choices=[
+    ('hour', 'Hour'),
+    ('day', 'Day'),
+    ])
+    bucket = models.DateTimeField()  # start of the hour or day, UTC
+    likes = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    saves = models.PositiveIntegerField(default=0)
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class PostRollup(EngagementRollup):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="rollups")
+
+    class Meta:
+        unique_together = ('post', 'granularity', 'bucket')
+
+    def __str__(self):
+        return f"{self.granularity} rollup for Post {self.post_id} at {self.bucket}"
+
+class UserRollup(EngagementRollup):
+    # Totals across all of the user's posts, plus follower growth.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="rollups")
+    new_followers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'granularity', 'bucket')
+
+    def __str__(self):
+        return f"{self.granularity} rollup for {self.user_id} at {self.bucket}"
+
+class AggregationCheckpoint(models.Model):
+    # High-water mark: the last primary key of `source` folded into the rollups.
+    source = models.CharField(max_length=20, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} aggregated up to {self.last_id}"
@@ -0,0 +1,75 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Set once the current request has written through the api app, or when the
+# client is still inside its read-your-writes window; reads then stay on the
+# primary so they never see a replica that is lagging behind.
+_pinned_to_primary = ContextVar("pinned_to_primary", default=False)
+
+# The replica chosen for the current request, reused by every read in it so
+# two queries never see replicas with different lag.
+_chosen_replica = ContextVar("chosen_replica", default=None)
+
+
+def pin_to_primary(pinned=True):
+    return _pinned_to_primary.set(pinned)
+
+
+def unpin(token):
+    _pinned_to_primary.reset(token)
+
+
+def is_pinned_to_primary():
+    return _pinned_to_primary.get()
+
+
+def choose_replica(replica=None):
+    """Set (or with None, clear) the replica for this context; returns a reset token."""
+    return _chosen_replica.set(replica)
+
+
+def release_replica(token):
+    _chosen_replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send `api` reads to one of settings.DATABASE_REPLICAS and every write to
+    the primary ('default'). Other apps are left to Django's default routing.
+    """
+    app_label = "api"
+
+    def _replicas(self):
+        return getattr(settings, "DATABASE_REPLICAS", [])
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+        replicas = self._replicas()
+        if not replicas or is_pinned_to_primary():
+            return "default"
+        replica = _chosen_replica.get()
+        if replica not in replicas:
+            replica = random.choice(replicas)
+            _chosen_replica.set(replica)
+        return replica
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+        pin_to_primary()
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *self._replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema from the primary, never directly.
+        if db in self._replicas():
+            return False
+        return None
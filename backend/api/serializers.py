@@ -1,3 +1,8 @@
+import re
+from django.conf import settings
+from django.core.files import File
+from django.core.validators import validate_image_file_extension
+from django.db.models import Sum
 from rest_framework import serializers
 from api.models import *
 
@@ -10,7 +15,7 @@ class PostSerializer(serializers.ModelSerializer):
     likes_count = serializers.SerializerMethodField()
     comments_count = serializers.SerializerMethodField()
     hashtags = serializers.SerializerMethodField()
-    views = serializers.IntegerField(default=0)  # Assuming views are tracked elsewhere
+    views = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
@@ -25,6 +30,18 @@ class PostSerializer(serializers.ModelSerializer):
     def get_hashtags(self, obj):
         return [tag.tag for tag in Hashtags.objects.filter(object_id=obj.post_id)]
 
+    def get_views(self, obj):
+        # Aggregated from PostView events by `aggregate_engagement`. PostViewSet
+        # annotates `views_total`; other callers fall back to one query.
+        if hasattr(obj, 'views_total'):
+            return obj.views_total
+        return PostRollup.objects.filter(post=obj, granularity='day').aggregate(total=Sum('views'))['total'] or 0
+
+class PostImageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PostImage
+        fields = "__all__"
+
 class HashtagsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Hashtags
@@ -63,4 +80,91 @@ class NotificationSerializer(serializers.ModelSerializer):
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = "__all__"
+        read_only_fields = ['received_bytes', 'status', 'created_at', 'expires_at']
+
+    def validate_total_size(self, value):
+        if value == 0 or value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Uploads must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+    def validate_filename(self, value):
+        # Uploads land in ImageFields, so only accept image extensions.
+        validate_image_file_extension(File(None, name=value))
+        return value
+
+    def validate_checksum(self, value):
+        if not re.match(r'^[0-9a-fA-F]{64}$', value):
+            raise serializers.ValidationError("Checksum must be a sha256 hex digest.")
+        return value.lower()
+
+    def validate(self, data):
+        if data.get('target') == 'post_image' and not data.get('post'):
+            raise serializers.ValidationError({"post": "A post is required for post image uploads."})
+        if data.get('target') != 'post_image' and data.get('post'):
+            raise serializers.ValidationError({"post": "A post can only be given for post image uploads."})
+        if data.get('post') and data['post'].user_id != data['user'].user_id:
+            raise serializers.ValidationError({"post": "Images can only be uploaded to your own posts."})
+        return data
+
+class AccountDeletionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AccountDeletion
+        fields = "__all__"
+
+def validate_view_targets(events):
+    """Check every post and user id in `events` with one query per table."""
+    post_ids = {event['post_id'] for event in events}
+    user_ids = {event['user_id'] for event in events if event.get('user_id')}
+    missing_posts = post_ids - set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+    missing_users = user_ids - set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    errors = {}
+    if missing_posts:
+        errors['post'] = f"Unknown post ids: {sorted(missing_posts)}"
+    if missing_users:
+        errors['user'] = f"Unknown user ids: {sorted(missing_users)}"
+    if errors:
+        raise serializers.ValidationError(errors)
+
+class PostViewListSerializer(serializers.ListSerializer):
+    def __init__(self, *args, **kwargs):
+        # Checked before any item is validated.
+        kwargs.setdefault('max_length', settings.ANALYTICS_MAX_VIEW_BATCH)
+        super().__init__(*args, **kwargs)
+
+    def validate(self, attrs):
+        validate_view_targets(attrs)
+        return attrs
+
+    def create(self, validated_data):
+        return PostView.objects.bulk_create([PostView(**item) for item in validated_data])
+
+class PostViewSerializer(serializers.ModelSerializer):
+    # Plain ids: the foreign keys are checked in bulk rather than per event.
+    post = serializers.IntegerField(source='post_id')
+    user = serializers.CharField(source='user_id', required=False, allow_null=True)
+
+    class Meta:
+        model = PostView
+        fields = "__all__"
+        list_serializer_class = PostViewListSerializer
+
+    def validate(self, attrs):
+        if self.parent is None:
+            validate_view_targets([attrs])
+        return attrs
+
+class PostRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PostRollup
+        fields = ['granularity', 'bucket', 'likes', 'comments', 'saves', 'views']
+
+class UserRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserRollup
+        fields = ['granularity', 'bucket', 'likes', 'comments', 'saves', 'views', 'new_followers']
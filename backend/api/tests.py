@@ -1,3 +1,439 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import uuid
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from api.analytics import aggregate_all
+from api.deletion import process_pending_deletions
+from api.middleware import ReplicaStickinessMiddleware
+from api.models import *
+from api.routers import ReplicaRouter, pin_to_primary, unpin
+from api.uploads import cleanup_abandoned_sessions, session_path
 
 # Create your tests here.
+
+
+def png_bytes(size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def use_temporary_dirs(test, *setting_names):
+    """Point each named setting at a fresh directory for the length of `test`."""
+    dirs = [tempfile.mkdtemp() for _ in setting_names]
+    for path in dirs:
+        test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    overrides = override_settings(**dict(zip(setting_names, dirs)))
+    overrides.enable()
+    test.addCleanup(overrides.disable)
+    return dirs
+
+
+class UploadSessionTests(TestCase):
+    def setUp(self):
+        self.media_dir, self.upload_dir = use_temporary_dirs(self, 'MEDIA_ROOT', 'UPLOAD_SESSION_DIR')
+
+        self.user = User.objects.create(user_id='bob', username='bob', password='x', email='bob@example.com')
+        self.data = png_bytes()
+        response = self.open_session()
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.json()['upload_id']
+
+    def open_session(self, **fields):
+        payload = {
+            'user': 'bob',
+            'target': 'story',
+            'filename': 'story.png',
+            'total_size': len(self.data),
+            'checksum': hashlib.sha256(self.data).hexdigest(),
+            **fields,
+        }
+        return self.client.post('/upload/', payload, content_type='application/json')
+
+    def put_chunk(self, start, end, **headers):
+        return self.client.put(
+            f'/upload/{self.upload_id}/chunk/',
+            self.data[start:end],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{len(self.data)}',
+            **headers,
+        )
+
+    def test_resume_after_interruption(self):
+        half = len(self.data) // 2
+        self.assertEqual(self.put_chunk(0, half).status_code, 200)
+
+        # A client that lost the connection asks where to continue from.
+        response = self.client.get(f'/upload/{self.upload_id}/')
+        self.assertEqual(response.json()['received_bytes'], half)
+
+        self.assertEqual(self.put_chunk(half, len(self.data)).status_code, 200)
+        response = self.client.post(f'/upload/{self.upload_id}/complete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['image'].startswith('http://testserver/'))
+        story = Story.objects.get(user=self.user)
+        with story.image.open('rb') as image:
+            self.assertEqual(image.read(), self.data)
+
+    def test_chunk_at_wrong_offset_is_rejected(self):
+        half = len(self.data) // 2
+        self.put_chunk(0, half)
+        response = self.put_chunk(0, half)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(UploadSession.objects.get().received_bytes, half)
+
+    def test_chunk_checksum_mismatch_keeps_offset(self):
+        response = self.put_chunk(0, 10, HTTP_X_CHUNK_CHECKSUM='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get().received_bytes, 0)
+
+    def test_lost_part_file_restarts_upload(self):
+        half = len(self.data) // 2
+        self.put_chunk(0, half)
+        shutil.rmtree(self.upload_dir)
+        response = self.put_chunk(half, len(self.data))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(UploadSession.objects.get().received_bytes, 0)
+
+    def test_non_image_extension_is_rejected(self):
+        response = self.open_session(target='profile_pic', filename='evil.html')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('filename', response.json())
+
+    def test_non_image_content_is_rejected_at_complete(self):
+        self.data = b'<html><script>alert(1)</script></html>'
+        UploadSession.objects.filter(pk=self.upload_id).update(
+            target='profile_pic', total_size=len(self.data), checksum=hashlib.sha256(self.data).hexdigest()
+        )
+        self.put_chunk(0, len(self.data))
+        response = self.client.post(f'/upload/{self.upload_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get().received_bytes, 0)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.profile_pic)
+
+    def test_post_is_rejected_for_non_post_targets(self):
+        post = Post.objects.create(user=self.user, caption='hello')
+        for target in ('story', 'profile_pic'):
+            response = self.open_session(target=target, post=post.post_id)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('post', response.json())
+
+    def test_cleanup_removes_stale_sessions_and_orphans(self):
+        live = UploadSession.objects.get()
+        self.put_chunk(0, 10)
+        expired = UploadSession.objects.create(
+            user=self.user, target='story', filename='old.png', total_size=10, checksum='0' * 64,
+            expires_at=timezone.now() - timedelta(minutes=1),
+        )
+        session_path(expired).write_bytes(b'stale')
+        finished = UploadSession.objects.create(
+            user=self.user, target='story', filename='done.png', total_size=10, checksum='0' * 64, status='complete',
+        )
+        UploadSession.objects.filter(pk=finished.pk).update(
+            created_at=timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL + 60)
+        )
+        orphan = Path(self.upload_dir) / f'{uuid.uuid4()}.part'
+        orphan.write_bytes(b'orphan')
+
+        self.assertEqual(cleanup_abandoned_sessions(), 2)
+        self.assertEqual(list(UploadSession.objects.all()), [live])
+        self.assertTrue(session_path(live).exists())
+        self.assertFalse(session_path(expired).exists())
+        self.assertFalse(orphan.exists())
+
+    def test_invalid_content_length_is_a_bad_request(self):
+        response = self.put_chunk(0, 10, CONTENT_LENGTH='ten')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), ['Content-Length must be an integer.'])
+
+    def test_whole_file_checksum_mismatch_resets_session(self):
+        UploadSession.objects.update(checksum='0' * 64)
+        self.put_chunk(0, len(self.data))
+        response = self.client.post(f'/upload/{self.upload_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get().received_bytes, 0)
+        self.assertEqual(self.put_chunk(0, len(self.data)).status_code, 200)
+
+
+class AccountDeletionTests(TestCase):
+    def setUp(self):
+        self.bob = User.objects.create(user_id='bob', username='bob', password='x', email='bob@example.com')
+        self.amy = User.objects.create(user_id='amy', username='amy', password='x', email='amy@example.com')
+        post_type = ContentType.objects.get_for_model(Post)
+        comment_type = ContentType.objects.get_for_model(Comment)
+        story_type = ContentType.objects.get_for_model(Story)
+        for i in range(5):
+            post = Post.objects.create(user=self.bob, caption=f'post {i}')
+            Like.objects.create(user=self.amy, content_type=post_type, object_id=post.post_id)
+            comment = Comment.objects.create(user=self.amy, content_type=post_type, object_id=post.post_id, commented_text='nice')
+            Like.objects.create(user=self.amy, content_type=comment_type, object_id=comment.id)
+            SavedPost.objects.create(user=self.amy, post=post)
+        own_comment = Comment.objects.create(
+            user=self.bob, content_type=post_type, object_id=post.post_id, commented_text='thanks'
+        )
+        Like.objects.create(user=self.amy, content_type=comment_type, object_id=own_comment.id)
+        Comment.objects.create(user=self.amy, content_type=comment_type, object_id=own_comment.id, commented_text='reply')
+        Comment.objects.create(user=self.amy, content_type=post_type, object_id=post.post_id, commented_text='threaded', parent=own_comment)
+        story = Story.objects.create(user=self.bob, image='images/story_pics/story.png')
+        Like.objects.create(user=self.amy, content_type=story_type, object_id=story.story_id)
+        Followers.objects.create(follower=self.amy, following=self.bob)
+        first = Message.objects.create(sender=self.bob, recipient=self.amy, subject='hi')
+        Message.objects.create(sender=self.amy, recipient=self.bob, subject='re: hi', replied_to=first)
+
+        self.amy_post = Post.objects.create(user=self.amy, caption='still here')
+        Comment.objects.create(user=self.amy, content_type=post_type, object_id=self.amy_post.post_id, commented_text='mine')
+
+    def test_destroy_queues_deletion(self):
+        response = self.client.delete('/user/bob/')
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(User.objects.filter(user_id='bob').exists())
+        self.assertEqual(AccountDeletion.objects.get().status, 'pending')
+
+    def test_batched_deletion_leaves_no_orphans(self):
+        AccountDeletion.objects.create(account='bob')
+        self.assertEqual(process_pending_deletions(batch_size=2), 1)
+
+        self.assertFalse(User.objects.filter(user_id='bob').exists())
+        self.assertEqual(AccountDeletion.objects.get().status, 'done')
+        self.assertEqual(list(Post.objects.all()), [self.amy_post])
+        self.assertEqual(Comment.objects.get().commented_text, 'mine')
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(SavedPost.objects.exists())
+        self.assertFalse(Story.objects.exists())
+        self.assertFalse(Followers.objects.exists())
+        self.assertFalse(Message.objects.exists())
+
+    def test_large_tables_and_media_are_cleared_in_batches(self):
+        use_temporary_dirs(self, 'MEDIA_ROOT')
+        profile_pic = default_storage.save('profile_pics/bob.png', ContentFile(png_bytes()))
+        User.objects.filter(pk='bob').update(profile_pic=profile_pic)
+        post = Post.objects.filter(user=self.bob).first()
+        post_image = PostImage.objects.create(post=post, image=default_storage.save('images/Post_pics/bob.png', ContentFile(png_bytes())))
+        story_image = default_storage.save('images/story_pics/story.png', ContentFile(png_bytes()))
+        for _ in range(3):
+            PostView.objects.create(post=self.amy_post, user=self.bob)
+        hidden = Message.objects.create(sender=self.amy, recipient=self.amy, subject='note')
+        hidden.deleted_for_user.add(self.bob)
+
+        AccountDeletion.objects.create(account='bob')
+        with CaptureQueriesContext(connection) as queries:
+            process_pending_deletions(batch_size=2)
+
+        # Views of other users' posts survive without the viewer.
+        self.assertEqual(PostView.objects.filter(post=self.amy_post, user=None).count(), 3)
+        self.assertFalse(Message.deleted_for_user.through.objects.exists())
+        for name in (profile_pic, post_image.image.name, story_image):
+            self.assertFalse(default_storage.exists(name))
+        # Three views detached two primary keys at a time.
+        batched = [
+            q['sql'] for q in queries
+            if q['sql'].startswith('UPDATE "api_postview"') and '"api_postview"."id" IN' in q['sql']
+        ]
+        self.assertEqual(len(batched), 2)
+
+    def test_claimed_request_is_skipped(self):
+        AccountDeletion.objects.create(account='bob', status='running', claimed_at=timezone.now())
+        self.assertEqual(process_pending_deletions(), 0)
+        self.assertTrue(User.objects.filter(user_id='bob').exists())
+
+
+class UserExportTests(TestCase):
+    def setUp(self):
+        use_temporary_dirs(self, 'MEDIA_ROOT')
+        self.bob = User.objects.create(user_id='bob', username='bob', password='x', email='bob@example.com')
+        self.amy = User.objects.create(user_id='amy', username='amy', password='x', email='amy@example.com')
+        self.post = Post.objects.create(user=self.bob, caption='hello')
+        self.image = PostImage.objects.create(
+            post=self.post, image=default_storage.save('images/Post_pics/hello.png', ContentFile(png_bytes()))
+        )
+        # A story whose file has gone missing from storage.
+        Story.objects.create(user=self.bob, image='images/story_pics/missing.png')
+        post_type = ContentType.objects.get_for_model(Post)
+        Comment.objects.create(user=self.bob, content_type=post_type, object_id=self.post.post_id, commented_text='first!')
+        Message.objects.create(sender=self.amy, recipient=self.bob, subject='hi', content='hello bob')
+        Followers.objects.create(follower=self.amy, following=self.bob)
+
+    def ndjson_records(self, body):
+        records = {}
+        for line in body.splitlines():
+            record = json.loads(line)
+            records.setdefault(record.pop('type'), []).append(record)
+        return records
+
+    def test_ndjson_export(self):
+        response = self.client.get('/user/bob/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = self.ndjson_records(b''.join(response.streaming_content))
+
+        self.assertEqual(records['profile'][0]['user_id'], 'bob')
+        self.assertEqual([post['caption'] for post in records['posts']], ['hello'])
+        self.assertEqual(records['post_images'][0]['image'], self.image.image.name)
+        self.assertEqual(records['comments'][0]['commented_text'], 'first!')
+        self.assertEqual(records['messages'][0]['content'], 'hello bob')
+        self.assertEqual(records['followers'][0]['follower_id'], 'amy')
+        self.assertNotIn('following', records)
+
+    def test_zip_export_includes_existing_media(self):
+        response = self.client.get('/user/bob/export/?archive=zip')
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+
+        names = archive.namelist()
+        self.assertIn('data.ndjson', names)
+        self.assertIn(f'media/{self.image.image.name}', names)
+        self.assertEqual(archive.read(f'media/{self.image.image.name}'), png_bytes())
+        self.assertNotIn('media/images/story_pics/missing.png', names)
+        records = self.ndjson_records(archive.read('data.ndjson'))
+        self.assertEqual(len(records['stories']), 1)
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    # 'replica' mirrors 'default' under test but is left out here, so any
+    # query that wrongly reaches it fails the test.
+    databases = {'default'}
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        # Writes made by earlier tests pin this thread to the primary.
+        self.addCleanup(unpin, pin_to_primary(False))
+
+    def routed_read(self, **cookies):
+        """Run a GET through the stickiness middleware and report where api reads go."""
+        seen = {}
+
+        def get_response(request):
+            seen['db'] = Post.objects.all().db
+            return HttpResponse()
+
+        request = RequestFactory().get('/post/')
+        request.COOKIES.update(cookies)
+        ReplicaStickinessMiddleware(get_response)(request)
+        return seen['db']
+
+    def test_api_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertIsNone(self.router.db_for_read(ContentType))
+
+    def test_write_pins_reads_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'api'))
+        self.assertIsNone(self.router.allow_migrate('default', 'api'))
+
+    def test_write_sets_sticky_cookie(self):
+        response = self.client.post('/user/', {
+            'user_id': 'bob', 'username': 'bob', 'password': 'Passw0rd!', 'email': 'bob@example.com',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        # The follow-up read carries the cookie and stays on the primary.
+        self.assertEqual(len(self.client.get('/user/').json()), 1)
+
+    @override_settings(DATABASE_REPLICAS=['replica', 'replica_b'])
+    def test_one_replica_per_request(self):
+        seen = set()
+
+        def get_response(request):
+            seen.update(Post.objects.all().db for _ in range(20))
+            return HttpResponse()
+
+        for _ in range(5):
+            seen.clear()
+            ReplicaStickinessMiddleware(get_response)(RequestFactory().get('/post/'))
+            self.assertEqual(len(seen), 1)
+
+    def test_sticky_cookie_reads_from_primary(self):
+        self.assertEqual(self.routed_read(), 'replica')
+        self.assertEqual(self.routed_read(**{settings.REPLICA_STICKY_COOKIE: '1'}), 'default')
+        # The pin does not leak past the request.
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+
+
+class EngagementRollupTests(TestCase):
+    def setUp(self):
+        self.bob = User.objects.create(user_id='bob', username='bob', password='x', email='bob@example.com')
+        self.amy = User.objects.create(user_id='amy', username='amy', password='x', email='amy@example.com')
+        self.post = Post.objects.create(user=self.bob, caption='hello')
+        post_type = ContentType.objects.get_for_model(Post)
+        Like.objects.create(user=self.amy, content_type=post_type, object_id=self.post.post_id)
+        Comment.objects.create(user=self.amy, content_type=post_type, object_id=self.post.post_id, commented_text='hi')
+        SavedPost.objects.create(user=self.amy, post=self.post)
+        Followers.objects.create(follower=self.amy, following=self.bob)
+        self.later = timezone.now() + timedelta(minutes=5)
+
+    def day_rollup(self, model, **filters):
+        return model.objects.get(granularity='day', **filters)
+
+    def test_batch_ingestion_uses_bulk_queries(self):
+        events = [{'post': self.post.post_id, 'user': 'amy'}] * 200
+        # One query per table to check the ids, one bulk insert.
+        with self.assertNumQueries(3):
+            response = self.client.post('/view/', events, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(PostView.objects.count(), 200)
+
+    def test_batch_ingestion_rejects_unknown_ids_and_oversized_batches(self):
+        response = self.client.post('/view/', [{'post': 999}], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        events = [{'post': self.post.post_id}] * (settings.ANALYTICS_MAX_VIEW_BATCH + 1)
+        with self.assertNumQueries(0):
+            response = self.client.post('/view/', events, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PostView.objects.exists())
+
+    def test_aggregation_is_idempotent_across_runs(self):
+        self.client.post('/view/', [{'post': self.post.post_id}] * 3, content_type='application/json')
+        aggregate_all(now=self.later, batch_size=2)
+        aggregate_all(now=self.later)
+
+        post_day = self.day_rollup(PostRollup, post=self.post)
+        self.assertEqual((post_day.likes, post_day.comments, post_day.saves, post_day.views), (1, 1, 1, 3))
+        user_day = self.day_rollup(UserRollup, user=self.bob)
+        self.assertEqual((user_day.views, user_day.new_followers), (3, 1))
+        self.assertEqual(PostRollup.objects.filter(granularity='hour').get().views, 3)
+
+        # Only rows past the high-water mark are counted on the next run.
+        self.client.post('/view/', {'post': self.post.post_id}, content_type='application/json')
+        aggregate_all(now=self.later)
+        self.assertEqual(self.day_rollup(PostRollup, post=self.post).views, 4)
+
+    def test_recent_rows_wait_for_the_lag_window(self):
+        aggregate_all(now=timezone.now())
+        self.assertFalse(PostRollup.objects.exists())
+
+    def test_analytics_rejects_invalid_dates(self):
+        for query in ('since=2024-02-30', 'since=2024-02-30T00:00', 'until=yesterday'):
+            response = self.client.get(f'/post/{self.post.post_id}/analytics/?{query}')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(query.split('=')[0], response.json())
+
+    def test_post_views_come_from_rollups(self):
+        self.client.post('/view/', [{'post': self.post.post_id}] * 2, content_type='application/json')
+        aggregate_all(now=self.later)
+        self.assertEqual(self.client.get(f'/post/{self.post.post_id}/').json()['views'], 2)
+        self.assertEqual(self.client.get('/post/').json()[0]['views'], 2)
+        response = self.client.get(f'/post/{self.post.post_id}/analytics/')
+        self.assertEqual(response.json()[0]['views'], 2)
+
@@ -0,0 +1,185 @@
+import hashlib
+import os
+import re
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from api.models import PostImage, Story, UploadSession
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class OffsetMismatch(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Chunk does not start at the current upload offset."
+    default_code = "offset_mismatch"
+
+
+def session_path(session):
+    return Path(settings.UPLOAD_SESSION_DIR) / f"{session.upload_id}.part"
+
+
+def parse_content_range(header, session):
+    """Return (start, length) for a `Content-Range: bytes start-end/total` header."""
+    match = CONTENT_RANGE_RE.match(header or "")
+    if not match:
+        raise ValidationError("Content-Range header must look like 'bytes start-end/total'.")
+    start, end, total = (int(group) for group in match.groups())
+    if total != session.total_size:
+        raise ValidationError("Content-Range total does not match the upload size.")
+    if end < start or end >= total:
+        raise ValidationError("Content-Range is out of bounds.")
+    length = end - start + 1
+    if length > settings.UPLOAD_MAX_CHUNK_SIZE:
+        raise ValidationError(f"Chunks may not exceed {settings.UPLOAD_MAX_CHUNK_SIZE} bytes.")
+    return start, length
+
+
+def write_chunk(session, stream, start, length, checksum=None):
+    """
+    Stream `length` bytes from `stream` onto the session's part file at `start`.
+
+    Only one read block is held in memory at a time. Bytes left behind by an
+    interrupted chunk are truncated away first, and the chunk is rolled back if
+    it arrives short or its sha256 does not match `checksum`. If the part file
+    holds fewer than `start` bytes, the session restarts from offset 0.
+    """
+    if session.status != 'pending' or session.is_expired:
+        raise ValidationError("Upload session is no longer accepting chunks.")
+    if start != session.received_bytes:
+        raise OffsetMismatch(f"Expected chunk at offset {session.received_bytes}.")
+
+    path = session_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if start and (not path.exists() or path.stat().st_size < start):
+        _reset(session)
+        raise OffsetMismatch("Previously received data was lost; restart the upload from offset 0.")
+
+    digest = hashlib.sha256()
+    remaining = length
+    with open(path, 'ab') as part:
+        part.truncate(start)
+        while remaining:
+            block = stream.read(min(settings.UPLOAD_READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            part.write(block)
+            digest.update(block)
+            remaining -= len(block)
+        if remaining:
+            part.truncate(start)
+            raise ValidationError("Chunk body is shorter than its Content-Range.")
+        if checksum and digest.hexdigest() != checksum.lower():
+            part.truncate(start)
+            raise ValidationError("Chunk checksum mismatch.")
+
+    updated = UploadSession.objects.filter(
+        pk=session.pk, status='pending', received_bytes=start
+    ).update(received_bytes=start + length)
+    if not updated:
+        raise OffsetMismatch("Upload offset changed while the chunk was being written.")
+    session.received_bytes = start + length
+    return session
+
+
+def _reset(session):
+    session_path(session).unlink(missing_ok=True)
+    UploadSession.objects.filter(pk=session.pk, status='pending').update(received_bytes=0)
+    session.received_bytes = 0
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(settings.UPLOAD_READ_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def assemble(session):
+    """
+    Verify the finished part file and save it into the session's target field.
+
+    A whole-file checksum mismatch, or a file Pillow cannot read as an image,
+    resets the session to offset 0 so the client can upload the file again.
+    """
+    if session.status != 'pending':
+        raise ValidationError("Upload session has already been completed.")
+    if session.is_expired:
+        raise ValidationError("Upload session has expired.")
+    if session.received_bytes != session.total_size:
+        raise ValidationError(f"Upload is incomplete: {session.received_bytes}/{session.total_size} bytes received.")
+    path = session_path(session)
+    if not path.exists() or file_checksum(path) != session.checksum.lower():
+        _reset(session)
+        raise ValidationError("Upload checksum mismatch; the upload has been reset to offset 0.")
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        _reset(session)
+        raise ValidationError("Upload is not a valid image; the upload has been reset to offset 0.")
+
+    with transaction.atomic(), open(path, 'rb') as part:
+        content = File(part, name=session.filename)
+        if session.target == 'post_image':
+            instance = PostImage(post=session.post)
+            instance.image.save(session.filename, content, save=True)
+        elif session.target == 'story':
+            instance = Story(user=session.user)
+            instance.image.save(session.filename, content, save=True)
+        else:
+            instance = session.user
+            instance.profile_pic.save(session.filename, content, save=True)
+        session.status = 'complete'
+        session.save(update_fields=['status'])
+
+    path.unlink(missing_ok=True)
+    return instance
+
+
+def discard(session):
+    session_path(session).unlink(missing_ok=True)
+    session.delete()
+
+
+def cleanup_abandoned_sessions(now=None):
+    """
+    Delete expired unfinished sessions, completed sessions older than
+    UPLOAD_SESSION_TTL, and any part files without a session.
+    """
+    now = now or timezone.now()
+    removed = 0
+    for session in UploadSession.objects.filter(status='pending', expires_at__lte=now).iterator():
+        discard(session)
+        removed += 1
+    completed_before = now - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    count, _ = UploadSession.objects.filter(status='complete', created_at__lte=completed_before).delete()
+    removed += count
+
+    directory = Path(settings.UPLOAD_SESSION_DIR)
+    if not directory.is_dir():
+        return removed
+    # Scan before querying: a session row always exists before its part file,
+    # so any file seen here whose session is missing afterwards is an orphan.
+    candidates = {}
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.part'):
+            try:
+                candidates[uuid.UUID(entry.name[:-len('.part')])] = entry.path
+            except ValueError:
+                continue
+    known = set(UploadSession.objects.filter(status='pending', upload_id__in=candidates).values_list('upload_id', flat=True))
+    for upload_id, file_path in candidates.items():
+        if upload_id not in known:
+            os.remove(file_path)
+    return removed
@@ -14,6 +14,8 @@ router.register(r'followers', FollowersViewSet)
 router.register(r'story', StoryViewSet)
 router.register(r'notification', NotificationViewSet)
 router.register(r'message', MessageViewSet)
+router.register(r'upload', UploadSessionViewSet)
+router.register(r'view', PostViewEventViewSet)
 
 urlpatterns = [
     path('',include(router.urls)),
@@ -1,15 +1,86 @@
-from rest_framework import viewsets 
+from datetime import datetime, time
+from django.core.files.storage import default_storage
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import exceptions, mixins, status, viewsets 
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from api.models import *
 from api.serializers import *
+from api import exports, uploads
+
+def rollup_range(queryset, request):
+    """Filter rollups by `?granularity=hour|day` (default day) and optional `since`/`until` datetimes."""
+    granularity = request.query_params.get('granularity', 'day')
+    if granularity not in ('hour', 'day'):
+        raise exceptions.ValidationError({"granularity": "Must be 'hour' or 'day'."})
+    queryset = queryset.filter(granularity=granularity)
+    for param, lookup in (('since', 'bucket__gte'), ('until', 'bucket__lt')):
+        value = request.query_params.get(param)
+        if value:
+            try:
+                # Well-formed but impossible values such as 2024-02-30 raise ValueError.
+                moment = parse_datetime(value)
+                if moment is None and parse_date(value):
+                    moment = datetime.combine(parse_date(value), time.min)
+            except ValueError:
+                moment = None
+            if moment is None:
+                raise exceptions.ValidationError({param: "Must be an ISO 8601 date or datetime."})
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            queryset = queryset.filter(**{lookup: moment})
+    return queryset.order_by('bucket')
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+
+    def destroy(self, request, *args, **kwargs):
+        # Dependent rows are removed in batches by `process_account_deletions`
+        # instead of one cascading delete that locks every related table.
+        user = self.get_object()
+        deletion, _ = AccountDeletion.objects.get_or_create(account=user.user_id)
+        if deletion.status == 'done':
+            deletion.status = 'pending'
+            deletion.completed_at = None
+            deletion.save(update_fields=['status', 'completed_at'])
+        return Response(AccountDeletionSerializer(deletion).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """Stream the user's data as NDJSON, or as a zip with media when `?archive=zip`."""
+        user = self.get_object()
+        if request.query_params.get('archive') == 'zip':
+            response = StreamingHttpResponse(exports.zip_archive(user, default_storage), content_type='application/zip')
+            response['Content-Disposition'] = f'attachment; filename="{user.user_id}-export.zip"'
+        else:
+            response = StreamingHttpResponse(exports.ndjson_lines(user), content_type='application/x-ndjson')
+            response['Content-Disposition'] = f'attachment; filename="{user.user_id}-export.ndjson"'
+        return response
+
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        user = self.get_object()
+        rollups = rollup_range(UserRollup.objects.filter(user=user), request)
+        return Response(UserRollupSerializer(rollups, many=True).data)
     
 
 class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all()
+    # Lifetime views from the daily rollups, read by PostSerializer.get_views.
+    queryset = Post.objects.annotate(
+        views_total=Coalesce(Sum('rollups__views', filter=Q(rollups__granularity='day')), 0)
+    )
     serializer_class = PostSerializer
+
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        post = self.get_object()
+        rollups = rollup_range(PostRollup.objects.filter(post=post), request)
+        return Response(PostRollupSerializer(rollups, many=True).data)
     
 
 class HashtagsViewSet(viewsets.ModelViewSet):
@@ -50,4 +121,61 @@ class NotificationViewSet(viewsets.ModelViewSet):
 class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
-    
\ No newline at end of file
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Chunked, resumable media uploads.
+
+    POST   /upload/                 open a session (user, target, post, filename, total_size, checksum)
+    GET    /upload/<id>/            current offset, used to resume after a dropped connection
+    PUT    /upload/<id>/chunk/      raw bytes with `Content-Range: bytes start-end/total`
+                                    and optionally `X-Chunk-Checksum: <sha256>`
+    POST   /upload/<id>/complete/   verify the whole-file checksum and save the media
+    DELETE /upload/<id>/            abandon the session
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        session = self.get_object()
+        start, length = uploads.parse_content_range(request.headers.get('Content-Range'), session)
+        try:
+            content_length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise exceptions.ValidationError("Content-Length must be an integer.")
+        if content_length != length:
+            raise exceptions.ValidationError("Content-Length does not match Content-Range.")
+        # Read the raw request stream so the chunk never passes through the parsers.
+        uploads.write_chunk(session, request.stream, start, length, request.headers.get('X-Chunk-Checksum'))
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        instance = uploads.assemble(session)
+        if session.target == 'post_image':
+            data = PostImageSerializer(instance, context=self.get_serializer_context()).data
+        elif session.target == 'story':
+            data = StorySerializer(instance, context=self.get_serializer_context()).data
+        else:
+            data = UserSerializer(instance, context=self.get_serializer_context()).data
+        return Response(data)
+
+
+class PostViewEventViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
+    """Batched view ingestion: POST a single event or a list of `{post, user}` events."""
+    queryset = PostView.objects.all()
+    serializer_class = PostViewSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        if isinstance(kwargs.get('data'), list):
+            kwargs['many'] = True
+        return super().get_serializer(*args, **kwargs)
@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaStickinessMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -87,9 +88,30 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # A read replica for the api app. Locally a copy of db.sqlite3 (or a
+    # second Postgres instance) stands in for it; tests mirror 'default'.
+    # Copy db.sqlite3 to db.replica.sqlite3 before adding 'replica' to
+    # DATABASE_REPLICAS, or every api read fails with "no such table".
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+# Aliases from DATABASES that serve api reads; writes always go to 'default'.
+# Add 'replica' here to route reads to it.
+DATABASE_REPLICAS = []
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# After a write, the same client reads from the primary for this many seconds
+# so it sees its own changes while the replicas catch up.
+REPLICA_STICKY_SECONDS = 10
+
+REPLICA_STICKY_COOKIE = 'pin_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -131,3 +153,35 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Chunked media uploads
+# Chunks are streamed straight to UPLOAD_SESSION_DIR and assembled into the
+# configured storage once the whole file has arrived.
+
+UPLOAD_SESSION_DIR = BASE_DIR / 'upload_sessions'
+
+UPLOAD_SESSION_TTL = 60 * 60 * 24  # seconds before an unfinished session is abandoned and a completed one pruned
+
+UPLOAD_MAX_SIZE = 100 * 1024 * 1024  # bytes
+
+UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024  # bytes
+
+UPLOAD_READ_BLOCK_SIZE = 64 * 1024  # bytes read from the request per iteration
+
+# Data export and account deletion
+
+EXPORT_CHUNK_SIZE = 2000  # rows fetched per database round trip while exporting
+
+EXPORT_MEDIA_BLOCK_SIZE = 64 * 1024  # bytes copied per iteration into the archive
+
+ACCOUNT_DELETION_BATCH_SIZE = 500  # rows removed per transaction by the deletion worker
+
+ACCOUNT_DELETION_STALE_SECONDS = 60 * 60  # a 'running' request untouched this long is assumed abandoned
+
+# Engagement analytics
+
+ANALYTICS_BATCH_SIZE = 5000  # source rows folded into the rollups per transaction
+
+ANALYTICS_LAG_SECONDS = 60  # rows younger than this are left for the next run so in-flight inserts are not skipped
+
+ANALYTICS_MAX_VIEW_BATCH = 500  # view events accepted per ingestion request